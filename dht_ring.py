@@ -1,5 +1,79 @@
 import simpy
 import random
+import bisect
+import collections
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def configure_logging(level=logging.DEBUG):
+    """
+    Affiche les événements des nœuds sur la sortie standard.
+
+    Sans cet appel, les messages de niveau DEBUG ne sont ni formatés ni écrits.
+    """
+    logging.basicConfig(level=level, format="%(message)s", stream=sys.stdout)
+
+
+# Enveloppe d'un message échangé entre nœuds (tuple nommé : léger et dépaquetable)
+Message = collections.namedtuple('Message', 'type sender content')
+
+
+class Ring:
+    """
+    Annuaire trié des nœuds d'un anneau, partagé par tous ses membres.
+
+    Permet de trouver une position par recherche dichotomique au lieu de
+    parcourir l'anneau voisin par voisin.
+    """
+
+    def __init__(self):
+        self.sorted_ids = []
+        self.nodes = []  # parallèle à sorted_ids
+        # Successeur déjà résolu par position ; vidé à chaque arrivée ou départ
+        self._successors = {}
+
+    def add(self, node):
+        """Insère un nœud à sa place dans l'annuaire."""
+        i = bisect.bisect_left(self.sorted_ids, node.node_id)
+        self.sorted_ids.insert(i, node.node_id)
+        self.nodes.insert(i, node)
+        self._successors.clear()
+
+    def remove(self, node):
+        """Retire un nœud de l'annuaire ; ValueError s'il n'en fait pas partie."""
+        i = self.index(node)
+        if i is None:
+            raise ValueError(f"{node} n'est pas dans l'annuaire de l'anneau")
+        del self.sorted_ids[i]
+        del self.nodes[i]
+        self._successors.clear()
+
+    def index(self, node):
+        """Retourne la position du nœud dans l'annuaire, ou None s'il n'en fait pas partie."""
+        i = bisect.bisect_left(self.sorted_ids, node.node_id)
+        while i < len(self.nodes) and self.sorted_ids[i] == node.node_id:
+            if self.nodes[i] is node:
+                return i
+            i += 1
+        return None
+
+    def neighbors(self, node_id):
+        """Retourne le prédécesseur et le successeur de la position `node_id`."""
+        i = bisect.bisect_left(self.sorted_ids, node_id)
+        return self.nodes[i - 1], self.nodes[i % len(self.nodes)]
+
+    def successor(self, key_id):
+        """Retourne le premier nœud rencontré depuis `key_id` dans le sens horaire."""
+        node = self._successors.get(key_id)
+        if node is None:
+            i = bisect.bisect_left(self.sorted_ids, key_id)
+            node = self._successors[key_id] = self.nodes[i % len(self.nodes)]
+        return node
+
 
 class Node:
     """
@@ -9,6 +83,10 @@ class Node:
     et peut rejoindre ou quitter dynamiquement l'anneau.
     """
 
+    # Attributs fixes : pas de __dict__ par nœud, accès direct par offset
+    __slots__ = ('env', 'node_id', '_str', 'left_neighbor', 'right_neighbor',
+                 'messages', '_message_event', 'ring')
+
     def __init__(self, env, node_id, bootstrap_node=None):
         """
         Initialise un nœud DHT.
@@ -20,9 +98,14 @@ class Node:
         """
         self.env = env
         self.node_id = node_id
+        self._str = f"Node({node_id})"  # construit une fois, affiché à chaque événement
         self.left_neighbor = self
         self.right_neighbor = self
-        self.messages = simpy.Store(env)
+        # Boîte aux lettres FIFO ; l'événement réveille run() quand elle se remplit
+        self.messages = collections.deque()
+        self._message_event = env.event()
+        self.ring = Ring()
+        self.ring.add(self)
 
         if bootstrap_node:
             self.env.process(self.join(bootstrap_node))
@@ -31,7 +114,7 @@ class Node:
         """
         Retourne une représentation textuelle du nœud.
         """
-        return f"Node({self.node_id})"
+        return self._str
 
     def send_message(self, target_node, message_type, content=None):
         """
@@ -42,12 +125,29 @@ class Node:
             message_type (str): Type du message (ex: 'JOIN_REQUEST').
             content (any, optional): Données supplémentaires.
         """
-        message = {
-            'type': message_type,
-            'sender': self,
-            'content': content
-        }
-        target_node.messages.put(message)
+        target_node.messages.append(Message(message_type, self, content))
+        event = target_node._message_event
+        if not event.triggered:
+            event.succeed()
+
+    def next_hop(self, target_id):
+        """
+        Choisit le voisin qui se rapproche le plus d'un identifiant cible.
+
+        Args:
+            target_id (int): Identifiant du nœud à atteindre.
+
+        Returns:
+            Node: Voisin le plus proche de la cible, ou None si aucun ne l'est
+            davantage que ce nœud.
+        """
+        best = None
+        best_distance = abs(self.node_id - target_id)
+        for neighbor in (self.left_neighbor, self.right_neighbor):
+            distance = abs(neighbor.node_id - target_id)
+            if distance < best_distance:
+                best, best_distance = neighbor, distance
+        return best
 
     def join(self, bootstrap_node):
         """
@@ -56,79 +156,90 @@ class Node:
         Args:
             bootstrap_node (Node): Nœud existant pour intégration dans l'anneau.
         """
-        print(f"{self.env.now}: {self} demande à rejoindre l'anneau via {bootstrap_node}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s demande à rejoindre l'anneau via %s", self.env.now, self, bootstrap_node)
         self.send_message(bootstrap_node, 'JOIN_REQUEST')
-
-        response = yield self.messages.get()
-        if response['type'] == 'JOIN_REPLY':
-            self.left_neighbor = response['content']['left_neighbor']
-            self.right_neighbor = response['content']['right_neighbor']
-
-            self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self)
-            self.send_message(self.right_neighbor, 'UPDATE_LEFT', self)
-
-            print(f"{self.env.now}: {self} a rejoint l'anneau entre {self.left_neighbor} et {self.right_neighbor}")
+        # La réponse est traitée par run(), seul lecteur de la boîte aux lettres
+        yield self.env.timeout(0)
 
     def leave(self):
         """
         Processus de départ propre du nœud de l'anneau.
         Met à jour les voisins pour les reconnecter entre eux.
         """
-        print(f"{self.env.now}: {self} quitte l'anneau")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s quitte l'anneau", self.env.now, self)
+        self.ring.remove(self)
 
         self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self.right_neighbor)
         self.send_message(self.right_neighbor, 'UPDATE_LEFT', self.left_neighbor)
 
-        print(f"{self.env.now}: {self} a quitté l'anneau, {self.left_neighbor} et {self.right_neighbor} sont maintenant connectés")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a quitté l'anneau, %s et %s sont maintenant connectés", self.env.now, self, self.left_neighbor, self.right_neighbor)
 
     def run(self):
         """
         Processus principal du nœud. Traite les messages entrants (JOIN, UPDATE...).
         """
-        print(f"{self.env.now}: {self} démarre")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s démarre", self.env.now, self)
+        yield from self.process_messages()
+
+    def process_messages(self):
+        """
+        Boucle de traitement : chaque message est confié à la méthode
+        enregistrée pour son type dans la table `_dispatch` de la classe.
+        """
         while True:
-            message = yield self.messages.get()
-            msg_type = message['type']
-            sender = message['sender']
-            content = message['content']
-
-            if msg_type == 'JOIN_REQUEST':
-                # Recherche de la position correcte dans l'anneau
-                current = self
-                next_node = self.right_neighbor
-
-                if current == next_node:
-                    self.right_neighbor = sender
-                    self.left_neighbor = sender
-                    self.send_message(sender, 'JOIN_REPLY', {
-                        'left_neighbor': self,
-                        'right_neighbor': self
-                    })
-                    continue
-
-                while True:
-                    if (current.node_id > next_node.node_id and 
-                        (sender.node_id > current.node_id or sender.node_id < next_node.node_id)):
-                        break
-                    if current.node_id < sender.node_id < next_node.node_id:
-                        break
-                    current = next_node
-                    next_node = current.right_neighbor
-                    if current == self:
-                        break
-
-                self.send_message(sender, 'JOIN_REPLY', {
-                    'left_neighbor': current,
-                    'right_neighbor': next_node
-                })
-
-            elif msg_type == 'UPDATE_LEFT':
-                self.left_neighbor = content
-                print(f"{self.env.now}: {self} a mis à jour son voisin de gauche: {self.left_neighbor}")
-
-            elif msg_type == 'UPDATE_RIGHT':
-                self.right_neighbor = content
-                print(f"{self.env.now}: {self} a mis à jour son voisin de droite: {self.right_neighbor}")
+            while not self.messages:
+                yield self._message_event
+                self._message_event = self.env.event()
+            msg_type, sender, content = self.messages.popleft()
+            handler = self._dispatch.get(msg_type)
+            if handler:
+                handler(self, sender, content)
+
+    def _handle_join_request(self, sender, content):
+        """Place le nouveau nœud dans l'anneau et lui indique ses voisins."""
+        left, right = self.ring.neighbors(sender.node_id)
+        self.ring.add(sender)
+        self.send_message(sender, 'JOIN_REPLY', {
+            'left_neighbor': left,
+            'right_neighbor': right,
+            'ring': self.ring
+        })
+
+    def _handle_join_reply(self, sender, content):
+        """S'insère entre les voisins indiqués et les prévient."""
+        self.left_neighbor = content['left_neighbor']
+        self.right_neighbor = content['right_neighbor']
+        self.ring = content['ring']
+
+        self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self)
+        self.send_message(self.right_neighbor, 'UPDATE_LEFT', self)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a rejoint l'anneau entre %s et %s", self.env.now, self, self.left_neighbor, self.right_neighbor)
+
+    def _handle_update_left(self, sender, content):
+        """Remplace le voisin de gauche."""
+        self.left_neighbor = content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a mis à jour son voisin de gauche: %s", self.env.now, self, self.left_neighbor)
+
+    def _handle_update_right(self, sender, content):
+        """Remplace le voisin de droite."""
+        self.right_neighbor = content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a mis à jour son voisin de droite: %s", self.env.now, self, self.right_neighbor)
+
+    # Table de dispatch : type de message -> méthode de traitement
+    _dispatch = {
+        'JOIN_REQUEST': _handle_join_request,
+        'JOIN_REPLY': _handle_join_reply,
+        'UPDATE_LEFT': _handle_update_left,
+        'UPDATE_RIGHT': _handle_update_right,
+    }
 
 
 def run_simulation(duration=100, max_nodes=10):
@@ -162,8 +273,11 @@ def run_simulation(duration=100, max_nodes=10):
         while True:
             yield env.timeout(random.randint(20, 30))
             if len(nodes) > 3:
-                node = random.choice(nodes[1:])
-                nodes.remove(node)
+                idx = random.randrange(1, len(nodes))
+                node = nodes[idx]
+                # Échange avec le dernier puis retrait : pas de recherche dans la liste
+                nodes[idx] = nodes[-1]
+                nodes.pop()
                 node.leave()
 
     env.process(node_creator())
@@ -1,6 +1,10 @@
 import simpy
 import random
-from dht_ring import Node
+import argparse
+import logging
+from dht_ring import Node, configure_logging
+
+log = logging.getLogger(__name__)
 
 def run_simulation(duration=100):
     env = simpy.Environment()
@@ -23,33 +27,45 @@ def run_simulation(duration=100):
             if len(nodes) > 1:
                 sender = random.choice(nodes)
                 target = random.choice(nodes)
-                print(f"{env.now}: {sender} veut envoyer un message à {target}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("%s: %s veut envoyer un message à %s", env.now, sender, target)
                 env.process(forward_message(sender, target, "MSG", "wsh pelo"))
     
     def forward_message(sender, target_node, message_type, content):
         """
-        Envoie un message en suivant l'anneau dans le sens des aiguilles d'une montre 
-        jusqu'à atteindre le nœud cible.
+        Envoie un message de voisin en voisin, chaque saut rapprochant le
+        message du nœud cible, jusqu'à l'atteindre.
+
+        Le trajet suit les voisins connus de chaque nœud ; un seul délai
+        couvre ensuite tous les sauts.
         """
         current_node = sender
         hops = 0
-        max_hops = len(nodes) * 2  # Limite pour éviter une boucle infinie
-        
-        while current_node != target_node and hops < max_hops:
-            next_hop = current_node.right_neighbor
-            print(f"{env.now}: {current_node} transfère le message à {next_hop}")
-            yield env.timeout(1)  # Simulation du délai de transmission
+        while current_node is not target_node:
+            next_hop = current_node.next_hop(target_node.node_id)
+            if next_hop is None:
+                break  # Aucun voisin ne se rapproche de la cible
             current_node = next_hop
             hops += 1
         
-        if current_node == target_node:
-            print(f"{env.now}: {target_node} a reçu le message: {message_type} - {content}")
-        else:
-            print(f"{env.now}: Le message n'a pas pu atteindre {target_node}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s transfère le message vers %s (%s sauts)", env.now, sender, target_node, hops)
+        yield env.timeout(hops)  # Un délai de transmission par saut
+        if current_node is target_node:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s: %s a reçu le message: %s - %s", env.now, target_node, message_type, content)
+        elif log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: Le message n'a pas pu atteindre %s", env.now, target_node)
     
     env.process(node_creator())
     env.process(message_sender())
     env.run(until=duration)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation du routage dans l'anneau DHT")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Affiche chaque événement des nœuds")
+    args = parser.parse_args()
+    if args.verbose:
+        configure_logging()
     run_simulation(200)
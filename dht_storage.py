@@ -1,7 +1,23 @@
 import simpy
 import random
+import argparse
 import hashlib
-from dht_ring import Node 
+import functools
+import logging
+from dht_ring import Node, configure_logging
+
+log = logging.getLogger(__name__)
+
+FINGER_COUNT = 7  # ceil(log2(100)) doigts de Chord par nœud
+
+
+@functools.lru_cache(maxsize=65536)
+def _key_hash(key):
+    """Hash SHA1 d'une clé sur la plage des node_id (0-99), mémorisé car les GET reprennent les mêmes clés"""
+    # Conversion directe des octets du condensé, sans passer par l'hexadécimal
+    digest = hashlib.sha1(str(key).encode(), usedforsecurity=False).digest()
+    return int.from_bytes(digest, 'big') % 100
+
 
 class StorageNode(Node):
     """
@@ -16,197 +32,210 @@ class StorageNode(Node):
         data_store (dict) : Données principales stockées localement.
         replicated_data (dict) : Données répliquées reçues des voisins.
     """
+    __slots__ = ('data_store', 'replicated_data', '_pending_replicas')
+
     def __init__(self, env, node_id, bootstrap_node=None):
         super().__init__(env, node_id, bootstrap_node)
         self.data_store = {} 
         self.replicated_data = {} 
+        self._pending_replicas = {}  # Répliques en attente d'envoi groupé
     
     def run(self):
         """Processus principal du nœud pour traiter les messages, étendu pour le stockage"""
-        print(f"{self.env.now}: {self} démarre (avec stockage)")
-        while True:
-            message = yield self.messages.get()
-            
-            msg_type = message['type']
-            sender = message['sender']
-            content = message['content']
-            
-            # Traitement des messages de l'anneau de base
-            if msg_type == 'JOIN_REQUEST':
-                # Code existant de la classe Node
-                current = self
-                next_node = self.right_neighbor
-                
-                if current == next_node:
-                    self.right_neighbor = sender
-                    self.left_neighbor = sender
-                    self.send_message(sender, 'JOIN_REPLY', {
-                        'left_neighbor': self, 
-                        'right_neighbor': self
-                    })
-                    continue
-                
-                while True:
-                    if (current.node_id > next_node.node_id and 
-                        (sender.node_id > current.node_id or sender.node_id < next_node.node_id)):
-                        break
-                    if current.node_id < sender.node_id < next_node.node_id:
-                        break
-                    current = next_node
-                    next_node = current.right_neighbor
-                    if current == self:
-                        break
-                
-                self.send_message(sender, 'JOIN_REPLY', {
-                    'left_neighbor': current, 
-                    'right_neighbor': next_node
-                })
-                
-                # Transférer les données pertinentes au nouveau nœud
-                self.env.process(self.transfer_relevant_data(sender))
-            
-            elif msg_type == 'UPDATE_LEFT':
-                self.left_neighbor = content
-                print(f"{self.env.now}: {self} a mis à jour son voisin de gauche: {self.left_neighbor}")
-                
-                # Répliquer les données sur le nouveau voisin
-                self.env.process(self.replicate_data_to_neighbor(self.left_neighbor))
-            
-            elif msg_type == 'UPDATE_RIGHT':
-                self.right_neighbor = content
-                print(f"{self.env.now}: {self} a mis à jour son voisin de droite: {self.right_neighbor}")
-                
-                # Répliquer les données sur le nouveau voisin
-                self.env.process(self.replicate_data_to_neighbor(self.right_neighbor))
-            
-            # Nouveaux types de messages pour le stockage
-            elif msg_type == 'PUT_REQUEST':
-                key = content['key']
-                value = content['value']
-                target_node = self.find_responsible_node(key)
-                
-                if target_node == self:
-                    # Ce nœud est responsable du stockage
-                    self.store_data(key, value)
-                    print(f"{self.env.now}: {self} stocke la donnée {key}:{value}")
-                    
-                    # Répliquer sur les voisins
-                    self.send_message(self.left_neighbor, 'REPLICATE', {'key': key, 'value': value})
-                    self.send_message(self.right_neighbor, 'REPLICATE', {'key': key, 'value': value})
-                    
-                    # Confirmer au demandeur
-                    self.send_message(sender, 'PUT_CONFIRM', {'key': key})
-                else:
-                    # Transférer la demande vers le nœud responsable
-                    print(f"{self.env.now}: {self} transfère la demande PUT pour {key} vers {self.right_neighbor}")
-                    self.send_message(self.right_neighbor, 'PUT_REQUEST', content)
-            
-            elif msg_type == 'GET_REQUEST':
-                key = content['key']
-                target_node = self.find_responsible_node(key)
-                
-                if target_node == self:
-                    # Ce nœud est responsable de la donnée
-                    if key in self.data_store:
-                        value = self.data_store[key]
-                        print(f"{self.env.now}: {self} fournit la donnée {key}:{value}")
-                        self.send_message(sender, 'GET_RESPONSE', {'key': key, 'value': value})
-                    else:
-                        print(f"{self.env.now}: {self} n'a pas trouvé la donnée {key}")
-                        self.send_message(sender, 'GET_RESPONSE', {'key': key, 'value': None})
-                else:
-                    # Transférer la demande vers le nœud responsable
-                    print(f"{self.env.now}: {self} transfère la demande GET pour {key} vers {self.right_neighbor}")
-                    self.send_message(self.right_neighbor, 'GET_REQUEST', content)
-            
-            elif msg_type == 'GET_RESPONSE' or msg_type == 'PUT_CONFIRM':
-                # Simple affichage de la confirmation
-                if msg_type == 'GET_RESPONSE':
-                    key = content['key']
-                    value = content['value']
-                    print(f"{self.env.now}: {self} a reçu la réponse GET pour {key}: {value}")
-                else:
-                    print(f"{self.env.now}: {self} a reçu la confirmation PUT pour {content['key']}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s démarre (avec stockage)", self.env.now, self)
+        yield from self.process_messages()
+    
+    # Traitement des messages de l'anneau de base
+    def _handle_join_request(self, sender, content):
+        """Insère le nouveau nœud comme la classe Node, puis lui transfère ses données"""
+        super()._handle_join_request(sender, content)
+        
+        # Transférer les données pertinentes au nouveau nœud
+        self.transfer_relevant_data(sender)
+    
+    def _handle_update_left(self, sender, content):
+        """Remplace le voisin de gauche et lui réplique les données"""
+        self.left_neighbor = content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a mis à jour son voisin de gauche: %s", self.env.now, self, self.left_neighbor)
+        
+        # Répliquer les données sur le nouveau voisin
+        self.replicate_data_to_neighbor(self.left_neighbor)
+    
+    def _handle_update_right(self, sender, content):
+        """Remplace le voisin de droite et lui réplique les données"""
+        self.right_neighbor = content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a mis à jour son voisin de droite: %s", self.env.now, self, self.right_neighbor)
+        
+        # Répliquer les données sur le nouveau voisin
+        self.replicate_data_to_neighbor(self.right_neighbor)
+    
+    # Nouveaux types de messages pour le stockage. Contenus en tuples, sans dict :
+    # PUT_REQUEST et GET_RESPONSE portent (clé, valeur), GET_REQUEST et PUT_CONFIRM la clé
+    def _handle_put_request(self, sender, content):
+        """Stocke la donnée si ce nœud en est responsable, sinon fait suivre la demande"""
+        key, value = content
+        target_node = self.find_responsible_node(key)
+        
+        if target_node == self:
+            # Ce nœud est responsable du stockage
+            self.store_data(key, value)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s: %s stocke la donnée %s:%s", self.env.now, self, key, value)
             
-            elif msg_type == 'REPLICATE':
-                # Stocker localement une donnée répliquée
-                key = content['key']
-                value = content['value']
-                self.replicated_data[key] = value
-                print(f"{self.env.now}: {self} a répliqué la donnée {key}:{value}")
+            # Répliquer sur les voisins (envoi groupé)
+            self.queue_replica(key, value)
             
-            elif msg_type == 'TRANSFER_DATA':
-                # Recevoir des données transférées d'un autre nœud
-                for key, value in content.items():
-                    self.data_store[key] = value
-                print(f"{self.env.now}: {self} a reçu {len(content)} données transférées")
+            # Confirmer au demandeur
+            self.send_message(sender, 'PUT_CONFIRM', key)
+        else:
+            # Transférer la demande vers le nœud responsable
+            next_hop = self.closest_preceding_node(_key_hash(key))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s: %s transfère la demande PUT pour %s vers %s", self.env.now, self, key, next_hop)
+            self.send_message(next_hop, 'PUT_REQUEST', content)
+    
+    def _handle_get_request(self, sender, content):
+        """Répond avec la donnée si ce nœud en est responsable, sinon fait suivre la demande"""
+        key = content
+        target_node = self.find_responsible_node(key)
+        
+        if target_node == self:
+            # Ce nœud est responsable de la donnée
+            if key in self.data_store:
+                value = self.data_store[key]
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("%s: %s fournit la donnée %s:%s", self.env.now, self, key, value)
+                self.send_message(sender, 'GET_RESPONSE', (key, value))
+            else:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("%s: %s n'a pas trouvé la donnée %s", self.env.now, self, key)
+                self.send_message(sender, 'GET_RESPONSE', (key, None))
+        else:
+            # Transférer la demande vers le nœud responsable
+            next_hop = self.closest_preceding_node(_key_hash(key))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s: %s transfère la demande GET pour %s vers %s", self.env.now, self, key, next_hop)
+            self.send_message(next_hop, 'GET_REQUEST', content)
+    
+    def _handle_get_response(self, sender, content):
+        """Simple affichage de la réponse"""
+        if log.isEnabledFor(logging.DEBUG):
+            key, value = content
+            log.debug("%s: %s a reçu la réponse GET pour %s: %s", self.env.now, self, key, value)
+    
+    def _handle_put_confirm(self, sender, content):
+        """Simple affichage de la confirmation"""
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a reçu la confirmation PUT pour %s", self.env.now, self, content)
+    
+    def _handle_replicate_batch(self, sender, content):
+        """Stocke d'un coup un lot de répliques"""
+        self.replicated_data.update(content)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a répliqué %s données", self.env.now, self, len(content))
+    
+    def _handle_transfer_data(self, sender, content):
+        """Reçoit des données transférées d'un autre nœud"""
+        self.data_store.update(content)  # Fusion en une boucle C
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a reçu %s données transférées", self.env.now, self, len(content))
+    
+    # Table de dispatch : celle de Node, étendue aux messages de stockage
+    _dispatch = {
+        **Node._dispatch,
+        'JOIN_REQUEST': _handle_join_request,
+        'UPDATE_LEFT': _handle_update_left,
+        'UPDATE_RIGHT': _handle_update_right,
+        'PUT_REQUEST': _handle_put_request,
+        'GET_REQUEST': _handle_get_request,
+        'GET_RESPONSE': _handle_get_response,
+        'PUT_CONFIRM': _handle_put_confirm,
+        'REPLICATE_BATCH': _handle_replicate_batch,
+        'TRANSFER_DATA': _handle_transfer_data,
+    }
     
     def generate_key_hash(self, key):
         """Génère un hash pour une clé donnée"""
-        hash_object = hashlib.sha1(str(key).encode())
-        hash_hex = hash_object.hexdigest()
-        # Convertir en entier sur la même plage que les IDs des nœuds
-        hash_int = int(hash_hex, 16) % 100  # Même plage que les node_id (0-99)
-        return hash_int
+        return _key_hash(key)
     
     def find_responsible_node(self, key):
         """Trouve le nœud responsable pour une clé donnée"""
-        key_hash = self.generate_key_hash(key)
+        key_hash = _key_hash(key)
         
-        # Parcourir l'anneau pour trouver le nœud responsable
-        current = self
-        while True:
-            next_node = current.right_neighbor
-            
-            # Cas particulier: limite de l'anneau
-            if current.node_id > next_node.node_id and (key_hash > current.node_id or key_hash <= next_node.node_id):
-                return next_node
-            
-            # Cas standard: clé entre deux nœuds consécutifs
-            if current.node_id < key_hash <= next_node.node_id:
-                return next_node
-            
-            # Si la clé correspond exactement à ce nœud
-            if current.node_id == key_hash:
-                return current
-            
-            current = next_node
-            
-            # Si on a fait le tour complet
-            if current == self:
-                return self  # Ce nœud est le plus proche
+        # Premier nœud à partir du hash dans l'annuaire trié de l'anneau
+        return self.ring.successor(key_hash)
+    
+    def closest_preceding_node(self, key_hash):
+        """
+        Prochain saut vers `key_hash` à la Chord : le plus lointain des doigts
+        successeur(node_id + 2^i) qui ne dépasse pas la clé, sinon le successeur
+        immédiat, qui est alors le responsable de la clé.
+
+        Les doigts sont lus dans l'annuaire trié de l'anneau au moment du saut ;
+        ils ne peuvent donc pas désigner un nœud qui a déjà quitté l'anneau. Chaque
+        saut rapproche strictement la demande de la clé : pas de boucle de
+        transfert possible, même quand les pointeurs de voisins sont périmés.
+        """
+        distance = (key_hash - self.node_id) % 100
+        for i in reversed(range(FINGER_COUNT)):
+            if (1 << i) <= distance:
+                finger = self.ring.successor((self.node_id + (1 << i)) % 100)
+                if 0 < (finger.node_id - self.node_id) % 100 <= distance:
+                    return finger
+        # Aucun nœud dans (node_id, key_hash] : le successeur suivant est le responsable
+        return self.ring.successor((self.node_id + 1) % 100)
     
     def store_data(self, key, value):
         """Stocke une donnée localement"""
         self.data_store[key] = value
     
+    def queue_replica(self, key, value):
+        """Met une réplique en attente ; celles d'un même instant partent en un seul REPLICATE_BATCH par voisin"""
+        if not self._pending_replicas:
+            self.env.process(self.flush_replicas())
+        self._pending_replicas[key] = value
+    
+    def flush_replicas(self):
+        """Envoie les répliques en attente aux deux voisins"""
+        yield self.env.timeout(0)
+        items, self._pending_replicas = self._pending_replicas, {}
+        self.send_message(self.left_neighbor, 'REPLICATE_BATCH', items)
+        if self.right_neighbor is not self.left_neighbor:
+            self.send_message(self.right_neighbor, 'REPLICATE_BATCH', items)
+    
     def transfer_relevant_data(self, new_node):
         """Transfère les données pertinentes à un nouveau nœud"""
-        data_to_transfer = {}
+        # Le nouveau nœud répond de l'arc (prédécesseur, new_node] : bornes lues
+        # une fois dans l'annuaire, puis un simple test d'arc par clé
+        ring = self.ring
+        start = ring.nodes[ring.index(new_node) - 1].node_id
+        span = (new_node.node_id - start) % 100
         
-        # Identifier les données dont le nouveau nœud est responsable
-        for key, value in list(self.data_store.items()):
-            responsible_node = self.find_responsible_node(key)
-            if responsible_node == new_node:
-                data_to_transfer[key] = value
-                del self.data_store[key]  # Ne plus stocker comme données principales
-                self.replicated_data[key] = value  # Mais garder comme réplique
+        # Identifier les données dont le nouveau nœud est responsable (lecture seule,
+        # donc sans copie du dictionnaire), puis les retirer en une passe
+        moving = [key for key in self.data_store if 0 < (_key_hash(key) - start) % 100 <= span]
         
-        if data_to_transfer:
-            print(f"{self.env.now}: {self} transfère {len(data_to_transfer)} données à {new_node}")
+        if moving:
+            data_to_transfer = {key: self.data_store.pop(key) for key in moving}  # Ne plus stocker comme données principales
+            self.replicated_data.update(data_to_transfer)  # Mais garder comme réplique
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%s: %s transfère %s données à %s", self.env.now, self, len(data_to_transfer), new_node)
             self.send_message(new_node, 'TRANSFER_DATA', data_to_transfer)
-            
-        yield self.env.timeout(0)  # Transforme la méthode en générateur pour SimPy
     
     def replicate_data_to_neighbor(self, neighbor):
-        """Réplique les données pertinentes sur un voisin"""
-        for key, value in self.data_store.items():
-            self.send_message(neighbor, 'REPLICATE', {'key': key, 'value': value})
-        yield self.env.timeout(0)  # Transforme la méthode en générateur pour SimPy
+        """Réplique les données pertinentes sur un voisin, en un seul message"""
+        if self.data_store:
+            # Copie : le lot reflète les données au moment de l'envoi
+            self.send_message(neighbor, 'REPLICATE_BATCH', dict(self.data_store))
     
     def leave(self):
         """Méthode étendue pour gérer le transfert de données lors du départ"""
-        print(f"{self.env.now}: {self} quitte l'anneau et transfère ses données")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s quitte l'anneau et transfère ses données", self.env.now, self)
+        self.ring.remove(self)
         
         # Transférer toutes les données primaires au voisin de droite
         if self.data_store:
@@ -216,20 +245,30 @@ class StorageNode(Node):
         self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self.right_neighbor)
         self.send_message(self.right_neighbor, 'UPDATE_LEFT', self.left_neighbor)
         
-        print(f"{self.env.now}: {self} a quitté l'anneau, {self.left_neighbor} et {self.right_neighbor} sont maintenant connectés")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s: %s a quitté l'anneau, %s et %s sont maintenant connectés", self.env.now, self, self.left_neighbor, self.right_neighbor)
+
+
+def random_delays(low, high, batch=64):
+    """Délais entiers uniformes dans [low, high], tirés par lots d'un seul appel à random.choices"""
+    choices = range(low, high + 1)
+    while True:
+        yield from random.choices(choices, k=batch)
 
 
 def put_operation(env, node, key, value):
     """Processus pour exécuter une opération PUT"""
-    print(f"{env.now}: Demande PUT {key}:{value} via {node}")
-    node.send_message(node, 'PUT_REQUEST', {'key': key, 'value': value})
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s: Demande PUT %s:%s via %s", env.now, key, value, node)
+    node.send_message(node, 'PUT_REQUEST', (key, value))
     yield env.timeout(0)  # Transforme la fonction en générateur pour SimPy
 
 
 def get_operation(env, node, key):
     """Processus pour exécuter une opération GET"""
-    print(f"{env.now}: Demande GET {key} via {node}")
-    node.send_message(node, 'GET_REQUEST', {'key': key})
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s: Demande GET %s via %s", env.now, key, node)
+    node.send_message(node, 'GET_REQUEST', key)
     yield env.timeout(0)  # Transforme la fonction en générateur pour SimPy
 
 
@@ -246,8 +285,9 @@ def run_storage_simulation(duration=100, max_nodes=10):
     # Processus pour ajouter des nœuds périodiquement
     def node_creator():
         next_node_id = 1
+        delays = random_delays(5, 15)
         while next_node_id < max_nodes:
-            yield env.timeout(random.randint(5, 15))
+            yield env.timeout(next(delays))
             
             new_node = StorageNode(env, node_id=next_node_id, bootstrap_node=random.choice(nodes))
             nodes.append(new_node)
@@ -257,42 +297,46 @@ def run_storage_simulation(duration=100, max_nodes=10):
     
     # Processus pour faire quitter des nœuds périodiquement
     def node_remover():
+        delays = random_delays(20, 30)
         while True:
-            yield env.timeout(random.randint(20, 30))
+            yield env.timeout(next(delays))
             if len(nodes) > 3:  # Garder au moins quelques nœuds
-                node = random.choice(nodes[1:])  # Ne pas supprimer le nœud initial
-                nodes.remove(node)
+                idx = random.randrange(1, len(nodes))  # Ne pas supprimer le nœud initial
+                node = nodes[idx]
+                # Échange avec le dernier puis retrait : pas de recherche dans la liste
+                nodes[idx] = nodes[-1]
+                nodes.pop()
                 node.leave()
     
-    # Variable pour suivre le nombre de données créées (partagée entre les processus)
-    next_data_id = 0
+    # Clés déjà créées (partagées entre les processus), reprises telles quelles par les GET
+    keys = []
     
     # Processus pour effectuer des opérations PUT périodiquement
     def data_creator():
-        nonlocal next_data_id
+        delays = random_delays(2, 8)
         while True:
-            yield env.timeout(random.randint(2, 8))
+            yield env.timeout(next(delays))
             if nodes:
                 # Choisir un nœud aléatoire pour initier la demande
                 node = random.choice(nodes)
                 # Créer une clé et une valeur
-                key = f"key-{next_data_id}"
-                value = f"value-{next_data_id}"
+                key = f"key-{len(keys)}"
+                value = f"value-{len(keys)}"
+                keys.append(key)
                 # Lancer l'opération PUT
                 env.process(put_operation(env, node, key, value))
-                next_data_id += 1
     
     # Processus pour effectuer des opérations GET périodiquement
     def data_retriever():
-        nonlocal next_data_id
         yield env.timeout(20)  # Attendre un peu que des données soient stockées
+        delays = random_delays(5, 10)
         while True:
-            yield env.timeout(random.randint(5, 10))
-            if nodes and next_data_id > 0:
+            yield env.timeout(next(delays))
+            if nodes and keys:
                 # Choisir un nœud aléatoire pour initier la demande
                 node = random.choice(nodes)
                 # Demander une clé existante avec une haute probabilité
-                key = f"key-{random.randint(0, max(0, next_data_id - 1))}"
+                key = random.choice(keys)
                 # Lancer l'opération GET
                 env.process(get_operation(env, node, key))
     
@@ -317,3 +361,13 @@ def run_storage_simulation(duration=100, max_nodes=10):
         print(f"{node} stocke {primary_count} données primaires et {replicated_count} répliques")
     
     print(f"\nTotal: {total_primary} données primaires et {total_replicated} répliques dans le système")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation d'un anneau DHT avec stockage")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Affiche chaque événement des nœuds")
+    args = parser.parse_args()
+    if args.verbose:
+        configure_logging()
+    run_storage_simulation()
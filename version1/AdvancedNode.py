@@ -1,66 +1,164 @@
+import bisect
+import logging
+import math
+import random
+
+from version1.Node import RING_SIZE, in_arc
 from version1.StorageNode import StorageNode
 
+FINGER_COUNT = 7  # ceil(log2(RING_SIZE)) doigts par nœud
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
 class AdvancedNode(StorageNode):
-    def init(self, env, node_id, all_nodes=None, mode='triche'):
-        super().__init__(env, node_id)  
+    __slots__ = ('long_links', '_link_ids', 'mode', '_route_cache')
+
+    def __init__(self, env, node_id, mode='triche'):
+        super().__init__(env, node_id)
         self.long_links = {}
+        self._link_ids = []  # clés de long_links, triées pour la recherche par bisect
         self.mode = mode  
-        self.all_nodes = all_nodes  # nécessaire uniquement pour le mode triche
+        # Prochain saut par cible, invalidé à chaque changement de voisins ou de liens
+        self._route_cache = {}
 
-    def __str__(self):
-        return f"AdvancedNode({self.node_id})"
+    def add_long_link(self, node):
+        if node is self or node.node_id in self.long_links:
+            return False
+        self.long_links[node.node_id] = node
+        bisect.insort(self._link_ids, node.node_id)
+        self._route_cache.clear()
+        return True
+
+    # Les départs ne balayent pas les tables des autres nœuds : un lien vers un
+    # nœud parti est détecté ici, au moment de s'en servir
+    def _drop_stale_links(self):
+        stale = [link_id for link_id, link in self.long_links.items() if link.ring is not self.ring]
+        for link_id in stale:
+            del self.long_links[link_id]
+            self._link_ids.remove(link_id)
+            if self.mode == 'triche':
+                # Le successeur du nœud parti a repris son arc, et donc ce doigt
+                self.add_long_link(self.ring.successor(link_id))
+
+    def is_responsible_for(self, target_id):
+        return in_arc(self.left_neighbor.node_id, target_id, self.node_id)
 
     def route_message(self, target_id, message):
-        if self.node_id == target_id:
-            print(f"{self.env.now:.1f}: {self} received message: {message}")
+        if self.is_responsible_for(target_id):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s received message: %s", self.env.now, self, message)
             return
         best = self.find_best_route(target_id)
-        print(f"{self.env.now:.1f}: {self} routing to {target_id} via {best}")
-        self.send_message(best, 'ROUTE', {'target_id': target_id, 'message': message})
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s routing to %s via %s", self.env.now, self, target_id, best)
+        # Contenu ROUTE : tuple (cible, message, sauts, source)
+        self.send_message(best, 'ROUTE', (target_id, message, 1, self))
 
     def find_best_route(self, target_id):
-        if target_id in self.long_links:
-            return self.long_links[target_id]
+        best = self._route_cache.get(target_id)
+        if best is None or best.ring is not self.ring:
+            best = self._route_cache[target_id] = self._compute_best_route(target_id)
+        return best
+
+    def _compute_best_route(self, target_id):
+        self._drop_stale_links()
         right = self.right_neighbor
+        if in_arc(self.node_id, target_id, right.node_id):
+            return right
+        # Doigt le plus proche précédant la cible (règle F[j] <= d < F[j+1])
+        best = right
+        d_best = (target_id - right.node_id) % RING_SIZE
+        ids = self._link_ids
+        if ids:
+            # Le lien de plus grand identifiant <= cible (ou le plus grand de
+            # tous, par bouclage) est celui qui la précède de plus près
+            i = bisect.bisect_right(ids, target_id) - 1
+            link_id = ids[i]
+            # Seul le bouclage (i == -1) donne un écart négatif : un tour suffit
+            d = target_id - link_id if i >= 0 else target_id - link_id + RING_SIZE
+            if d < d_best:
+                best, d_best = self.long_links[link_id], d
+        # Vers la gauche, la distance se mesure dans le sens antihoraire
         left = self.left_neighbor
-        d_right = (target_id - right.node_id) % 100
-        d_left = (target_id - left.node_id) % 100
-        return right if d_right < d_left else left
+        d_left = (left.node_id - target_id) % RING_SIZE
+        return best if d_best <= d_left else left
 
     def run(self):
-        print(f"{self.env.now:.1f}: {self} started")
         self.env.process(self._create_long_links())
-        while True:
-            msg = yield self.messages.get()
-            t = msg['type']
-            c = msg['content']
-            s = msg['sender']
-
-            # Mode piggyback : découvrir d'autres nœuds
-            if self.mode == 'piggyback' and s.node_id not in self.long_links:
-                self.long_links[s.node_id] = s
-                print(f"{self.env.now:.1f}: {self} discovered node {s.node_id} via piggybacking")
-
-            if t in ['JOIN_REQUEST', 'UPDATE_LEFT', 'UPDATE_RIGHT', 'STORE', 'STORE_CONFIRM', 'REPLICATE']:
-                yield self.env.process(StorageNode.run(self))
-            elif t == 'ROUTE':
-                tid = c['target_id']
-                m = c['message']
-                if self.node_id == tid:
-                    print(f"{self.env.now:.1f}: {self} got routed message: {m}")
-                else:
-                    next_hop = self.find_best_route(tid)
-                    self.send_message(next_hop, 'ROUTE', {'target_id': tid, 'message': m})
+        yield from super().run()
+
+    def _handle(self, message):
+        s = message.sender
+        # Mode piggyback : découvrir d'autres nœuds
+        if self.mode == 'piggyback' and self.add_long_link(s):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s discovered node %s via piggybacking", self.env.now, self, s.node_id)
+        super()._handle(message)
+
+    def _handle_join_response(self, message):
+        super()._handle_join_response(message)
+        self._route_cache.clear()
+
+    def _handle_update_left(self, message):
+        super()._handle_update_left(message)
+        self._route_cache.clear()
+
+    def _handle_update_right(self, message):
+        super()._handle_update_right(message)
+        self._route_cache.clear()
+
+    def _handle_route(self, message):
+        tid, m, hops, source = message.content
+        if self.is_responsible_for(tid):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s got routed message from %s after %d hops: %s",
+                          self.env.now, self, source, hops, m)
+        else:
+            next_hop = self.find_best_route(tid)
+            self.send_message(next_hop, 'ROUTE', (tid, m, hops + 1, source))
 
     def _create_long_links(self):
         yield self.env.timeout(10)
-        if self.mode == 'triche' and self.all_nodes:
-            # Ajoute des liens vers des nœuds à +10, +20, +40
-            for offset in [10, 20, 40]:
-                target_id = (self.node_id + offset) % 100
-                for node in self.all_nodes:
-                    if node.node_id == target_id:
-                        self.long_links[node.node_id] = node
-                        print(f"{self.env.now:.1f}: {self} created long link to {node}")
+        if self.mode == 'triche':
+            # Table des doigts à la Chord : finger[i] = successeur(node_id + 2^i),
+            # lue directement dans l'annuaire trié de l'anneau
+            for i in range(FINGER_COUNT):
+                node = self.ring.successor((self.node_id + (1 << i)) % RING_SIZE)
+                if self.add_long_link(node):
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("%.1f: %s created long link to %s", self.env.now, self, node)
         elif self.mode == 'piggyback':
-            print(f"{self.env.now:.1f}: {self} will build long links using piggybacking")
\ No newline at end of file
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s will build long links using piggybacking", self.env.now, self)
+        elif self.mode == 'symphony':
+            # Symphony : k = log2(n) liens tirés selon p(x) = 1 / (x ln n)
+            n = len(self.ring.nodes)
+            for _ in range(max(1, round(math.log2(n)))):
+                x = math.exp(math.log(n) * (random.random() - 1))
+                target_id = (self.node_id + int(x * RING_SIZE)) % RING_SIZE
+                if not self.is_responsible_for(target_id):
+                    self.send_message(self.find_best_route(target_id), 'LONG_LINK_REQUEST',
+                                      {'target_id': target_id, 'origin': self})
+
+    def _handle_long_link_request(self, message):
+        c = message.content
+        if self.is_responsible_for(c['target_id']):
+            self.send_message(c['origin'], 'LONG_LINK_REPLY')
+        else:
+            self.send_message(self.find_best_route(c['target_id']), 'LONG_LINK_REQUEST', c)
+
+    def _handle_long_link_reply(self, message):
+        if self.add_long_link(message.sender):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s created long link to %s", self.env.now, self, message.sender)
+
+    _dispatch = {
+        **StorageNode._dispatch,
+        'JOIN_RESPONSE': _handle_join_response,
+        'UPDATE_LEFT': _handle_update_left,
+        'UPDATE_RIGHT': _handle_update_right,
+        'ROUTE': _handle_route,
+        'LONG_LINK_REQUEST': _handle_long_link_request,
+        'LONG_LINK_REPLY': _handle_long_link_reply,
+    }
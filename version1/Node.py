@@ -1,73 +1,200 @@
 
-import simpy
+import atexit
+import bisect
+import collections
+import logging
+import logging.handlers
+import queue
+import sys
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+_log_queue = queue.Queue()
+_listener = None
+
+
+# Affiche les événements des nœuds (logger "version1") sur la sortie standard.
+# Les enregistrements passent par une file vidée par un thread d'écriture,
+# la boucle simpy ne bloque donc pas sur stdout. Un second appel ne fait rien.
+def configure_logging(level=logging.DEBUG):
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(_log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    package_log = logging.getLogger("version1")
+    package_log.addHandler(logging.handlers.QueueHandler(_log_queue))
+    package_log.setLevel(level)
+
+
+# Attend que le thread d'écriture ait tout affiché (avant un print direct)
+def flush_logging():
+    _log_queue.join()
+
+RING_SIZE = 100  # Espace des identifiants : 0..99
+
+
+# Vrai si `key` appartient à l'arc (start, end] de l'anneau
+def in_arc(start, key, end):
+    if start == end:
+        return True  # Un seul nœud : il couvre tout l'anneau
+    return 0 < (key - start) % RING_SIZE <= (end - start) % RING_SIZE
+
+
+class Message:
+    __slots__ = ('type', 'sender', 'content')
+
+    def __init__(self, msg_type, sender, content):
+        self.type = msg_type
+        self.sender = sender
+        self.content = content
+
+
+# Annuaire trié des nœuds d'un anneau, partagé par tous ses membres
+class Ring:
+    def __init__(self):
+        self.sorted_ids = []
+        self.nodes = []  # parallèle à sorted_ids
+
+    def add(self, node):
+        i = bisect.bisect_left(self.sorted_ids, node.node_id)
+        self.sorted_ids.insert(i, node.node_id)
+        self.nodes.insert(i, node)
+
+    # ValueError si le nœud ne fait pas partie de l'annuaire
+    def remove(self, node):
+        i = self.index(node)
+        if i is None:
+            raise ValueError(f"{node} n'est pas dans l'annuaire de l'anneau")
+        del self.sorted_ids[i]
+        del self.nodes[i]
+
+    # Position du nœud dans l'annuaire, ou None s'il n'en fait pas partie
+    def index(self, node):
+        i = bisect.bisect_left(self.sorted_ids, node.node_id)
+        while i < len(self.nodes) and self.sorted_ids[i] == node.node_id:
+            if self.nodes[i] is node:
+                return i
+            i += 1
+        return None
+
+    # Prédécesseur et successeur de la position `node_id`
+    def neighbors(self, node_id):
+        i = bisect.bisect_left(self.sorted_ids, node_id)
+        return self.nodes[i - 1], self.nodes[i % len(self.nodes)]
+
+    # Premier nœud rencontré en partant de `key_id` dans le sens horaire
+    def successor(self, key_id):
+        i = bisect.bisect_left(self.sorted_ids, key_id)
+        return self.nodes[i % len(self.nodes)]
+
 
 class Node:
+    # Attributs fixes : pas de __dict__ par nœud, accès direct par offset
+    __slots__ = ('env', 'node_id', '_str', 'left_neighbor', 'right_neighbor',
+                 'messages', '_post', '_message_event', 'ring')
+
     def __init__(self, env, node_id):
         self.env = env
         self.node_id = node_id
+        # Nom affiché, construit une fois : "Node(3)", "StorageNode(3)"...
+        self._str = f"{type(self).__name__}({node_id})"
         self.left_neighbor = self
         self.right_neighbor = self
-        self.messages = simpy.Store(env)
+        # Boîte aux lettres FIFO ; l'événement réveille run() quand elle se remplit
+        self.messages = collections.deque()
+        self._post = self.messages.append  # méthode liée une fois pour toutes
+        self._message_event = env.event()
+        self.ring = Ring()
+        self.ring.add(self)
 
     def __str__(self):
-        return f"Node({self.node_id})"
+        return self._str
 
     def send_message(self, target, message_type, content=None):
-        message = {
-            'type': message_type,
-            'sender': self,
-            'content': content
-        }
-        target.messages.put(message)
+        target._post(Message(message_type, self, content))
+        event = target._message_event
+        if not event.triggered:
+            event.succeed()
 
     def join(self, bootstrap_node):
-        print(f"{self.env.now:.1f}: {self} requests to join via {bootstrap_node}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s requests to join via %s", self.env.now, self, bootstrap_node)
         self.send_message(bootstrap_node, 'JOIN_REQUEST')
-        response = yield self.messages.get()
-        if response['type'] == 'JOIN_RESPONSE':
-            self.left_neighbor = response['content']['left']
-            self.right_neighbor = response['content']['right']
-            self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self)
-            self.send_message(self.right_neighbor, 'UPDATE_LEFT', self)
-            print(f"{self.env.now:.1f}: {self} joined between {self.left_neighbor} and {self.right_neighbor}")
+        # La réponse arrive dans la boîte de run() : un seul consommateur
+        yield self.env.timeout(0)
 
     def leave(self):
-        print(f"{self.env.now:.1f}: {self} is leaving the ring")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s is leaving the ring", self.env.now, self)
+        self.ring.remove(self)
         self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self.right_neighbor)
         self.send_message(self.right_neighbor, 'UPDATE_LEFT', self.left_neighbor)
+        # Hors de l'anneau, le nœud redevient seul, comme à sa création
+        self.left_neighbor = self
+        self.right_neighbor = self
+        self.ring = Ring()
+        self.ring.add(self)
 
     def run(self):
-        print(f"{self.env.now:.1f}: {self} started")
-        while True:
-            message = yield self.messages.get()
-            msg_type = message['type']
-            sender = message['sender']
-            content = message['content']
-
-            if msg_type == 'JOIN_REQUEST':
-                self._handle_join_request(sender)
-            elif msg_type == 'UPDATE_LEFT':
-                self.left_neighbor = content
-                print(f"{self.env.now:.1f}: {self} updated left neighbor to {self.left_neighbor}")
-            elif msg_type == 'UPDATE_RIGHT':
-                self.right_neighbor = content
-                print(f"{self.env.now:.1f}: {self} updated right neighbor to {self.right_neighbor}")
-            elif msg_type == 'PING':
-                print(f"{self.env.now:.1f}: {self} received ping from {sender}")
-                self.send_message(sender, 'PONG')
-            elif msg_type == 'PONG':
-                print(f"{self.env.now:.1f}: {self} received pong from {sender}")
-
-    def _handle_join_request(self, new_node):
-        current = self
-        next_node = self.right_neighbor
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s started", self.env.now, self)
         while True:
-            if ((current.node_id < new_node.node_id <= next_node.node_id) or
-                (current.node_id > next_node.node_id and
-                 (new_node.node_id > current.node_id or new_node.node_id <= next_node.node_id))):
-                break
-            current = next_node
-            next_node = current.right_neighbor
-            if current == self:
-                break
-        self.send_message(new_node, 'JOIN_RESPONSE', {'left': current, 'right': next_node})
\ No newline at end of file
+            while not self.messages:
+                yield self._message_event
+                self._message_event = self.env.event()
+            self._handle(self.messages.popleft())
+
+    def _handle(self, message):
+        handler = self._dispatch.get(message.type)
+        if handler:
+            handler(self, message)
+
+    def _handle_join_request(self, message):
+        new_node = message.sender
+        left, right = self.ring.neighbors(new_node.node_id)
+        self.ring.add(new_node)
+        self.send_message(new_node, 'JOIN_RESPONSE', {'left': left, 'right': right, 'ring': self.ring})
+
+    def _handle_join_response(self, message):
+        self.left_neighbor = message.content['left']
+        self.right_neighbor = message.content['right']
+        self.ring = message.content['ring']
+        self.send_message(self.left_neighbor, 'UPDATE_RIGHT', self)
+        self.send_message(self.right_neighbor, 'UPDATE_LEFT', self)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s joined between %s and %s", self.env.now, self, self.left_neighbor, self.right_neighbor)
+
+    def _handle_update_left(self, message):
+        self.left_neighbor = message.content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s updated left neighbor to %s", self.env.now, self, self.left_neighbor)
+
+    def _handle_update_right(self, message):
+        self.right_neighbor = message.content
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s updated right neighbor to %s", self.env.now, self, self.right_neighbor)
+
+    def _handle_ping(self, message):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s received ping from %s", self.env.now, self, message.sender)
+        self.send_message(message.sender, 'PONG')
+
+    def _handle_pong(self, message):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s received pong from %s", self.env.now, self, message.sender)
+
+    # Table de dispatch type -> handler, construite une fois au chargement de la classe
+    _dispatch = {
+        'JOIN_REQUEST': _handle_join_request,
+        'JOIN_RESPONSE': _handle_join_response,
+        'UPDATE_LEFT': _handle_update_left,
+        'UPDATE_RIGHT': _handle_update_right,
+        'PING': _handle_ping,
+        'PONG': _handle_pong,
+    }
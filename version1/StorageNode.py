@@ -1,63 +1,74 @@
-from version1.Node import Node 
-import hashlib
+from version1.Node import Node, RING_SIZE
+import functools
+import logging
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+# Position d'une clé sur l'anneau (FNV-1a 64 bits : pas besoin d'un hash
+# cryptographique pour 100 positions), mémorisée car les mêmes clés reviennent
+@functools.lru_cache(maxsize=4096)
+def _key_hash(key):
+    h = 0xcbf29ce484222325
+    for c in str(key).encode():
+        h = ((h ^ c) * 0x100000001b3) & 0xffffffffffffffff
+    return h % RING_SIZE
+
 
 class StorageNode(Node):
+    __slots__ = ('data', 'replicas', '_pending_replicas')
+
     def __init__(self, env, node_id):
         super().__init__(env, node_id)
         self.data = {}
         self.replicas = {}
-
-    def __str__(self):
-        return f"StorageNode({self.node_id})"
+        self._pending_replicas = {}
 
     def compute_key_location(self, key):
-        h = hashlib.sha1(str(key).encode()).hexdigest()
-        target_id = int(h, 16) % 100
-        current = self
-        while True:
-            right = current.right_neighbor
-            if ((current.node_id < target_id <= right.node_id) or
-                (current.node_id > right.node_id and
-                 (target_id > current.node_id or target_id <= right.node_id))):
-                return right
-            current = right
-            if current == self:
-                return self
+        return self.ring.successor(_key_hash(key))
 
     def store(self, key, value):
         target = self.compute_key_location(key)
-        if target == self:
-            print(f"{self.env.now:.1f}: {self} storing {key}={value} (primary)")
+        if target is self:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s storing %s=%s (primary)", self.env.now, self, key, value)
             self.data[key] = value
-            self.send_message(self.left_neighbor, 'REPLICATE', {'key': key, 'value': value})
-            if self.right_neighbor != self.left_neighbor:
-                self.send_message(self.right_neighbor, 'REPLICATE', {'key': key, 'value': value})
+            self._queue_replica(key, value)
         else:
             self.send_message(target, 'STORE', {'key': key, 'value': value, 'origin': self})
 
-    def run(self):
-        print(f"{self.env.now:.1f}: {self} started")
-        while True:
-            message = yield self.messages.get()
-            t = message['type']
-            s = message['sender']
-            c = message['content']
-
-            if t == 'JOIN_REQUEST':
-                self._handle_join_request(s)
-            elif t == 'UPDATE_LEFT':
-                self.left_neighbor = c
-            elif t == 'UPDATE_RIGHT':
-                self.right_neighbor = c
-            elif t == 'STORE':
-                k = c['key']; v = c['value']; o = c['origin']
-                self.data[k] = v
-                self.send_message(self.left_neighbor, 'REPLICATE', {'key': k, 'value': v})
-                if self.right_neighbor != self.left_neighbor:
-                    self.send_message(self.right_neighbor, 'REPLICATE', {'key': k, 'value': v})
-                if o != self:
-                    self.send_message(o, 'STORE_CONFIRM', {'key': k})
-            elif t == 'STORE_CONFIRM':
-                print(f"{self.env.now:.1f}: {self} confirmed storage of {c['key']}")
-            elif t == 'REPLICATE':
-                self.replicas[c['key']] = c['value']
\ No newline at end of file
+    # Les répliques d'un même instant partent en un seul REPLICATE_BATCH par voisin
+    def _queue_replica(self, key, value):
+        if not self._pending_replicas:
+            self.env.process(self._flush_replicas())
+        self._pending_replicas[key] = value
+
+    def _flush_replicas(self):
+        yield self.env.timeout(0)
+        items, self._pending_replicas = self._pending_replicas, {}
+        self.send_message(self.left_neighbor, 'REPLICATE_BATCH', items)
+        if self.right_neighbor is not self.left_neighbor:
+            self.send_message(self.right_neighbor, 'REPLICATE_BATCH', items)
+
+    def _handle_store(self, message):
+        c = message.content
+        k = c['key']; v = c['value']; o = c['origin']
+        self.data[k] = v
+        self._queue_replica(k, v)
+        if o is not self:
+            self.send_message(o, 'STORE_CONFIRM', {'key': k})
+
+    def _handle_store_confirm(self, message):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s confirmed storage of %s", self.env.now, self, message.content['key'])
+
+    def _handle_replicate_batch(self, message):
+        self.replicas.update(message.content)
+
+    _dispatch = {
+        **Node._dispatch,
+        'STORE': _handle_store,
+        'STORE_CONFIRM': _handle_store_confirm,
+        'REPLICATE_BATCH': _handle_replicate_batch,
+    }
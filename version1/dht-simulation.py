@@ -7,15 +7,17 @@ A reliable, simplified implementation of a DHT (Distributed Hash Table) simulato
 
 import simpy
 import random
-import hashlib
 import argparse
+import logging
 import sys
 from enum import Enum
 
-from version1.Node import Node
+from version1.Node import Node, configure_logging, flush_logging
 from version1.StorageNode import StorageNode
 from version1.AdvancedNode import AdvancedNode
 
+log = logging.getLogger("version1.simulation")
+
 
 class DemoLevel(Enum):
     BASIC = "basic"       # Just a ring with node join/leave
@@ -23,72 +25,144 @@ class DemoLevel(Enum):
     ADVANCED = "advanced" # Adding advanced routing
 
 
-def run_basic_simulation(env, max_nodes=10, duration=100):
-    """Run a basic DHT simulation"""
-    print("Starting basic DHT simulation...")
-    
-    # Create first node
-    first_node = Node(env, node_id=0)
-    env.process(first_node.run())
+# Process to add new nodes periodically
+def _node_creator(env, node_class, nodes, max_nodes):
+    next_id = 1
+    while next_id < max_nodes:
+        yield env.timeout(random.randint(3, 8))
+        
+        # Create a new node
+        new_node = node_class(env, node_id=next_id)
+        env.process(new_node.run())
+        
+        # Choose a random existing node to bootstrap
+        bootstrap = random.choice(nodes)
+        
+        # Join the ring
+        env.process(new_node.join(bootstrap))
+        
+        # Add to our node list
+        nodes.append(new_node)
+        next_id += 1
+
+# Process to remove nodes periodically
+def _node_remover(env, nodes, warmup, delay):
+    yield env.timeout(warmup)  # Wait for some nodes to join
     
-    nodes = [first_node]
+    while True:
+        yield env.timeout(random.randint(*delay))
+        
+        # Only remove if we have enough nodes
+        if len(nodes) > 3:
+            # Choose a random node to remove (not the first node)
+            idx = random.randrange(1, len(nodes))
+            node = nodes[idx]
+            node.leave()
+            # Swap-and-pop: the order of nodes past the first one doesn't matter
+            nodes[idx] = nodes[-1]
+            nodes.pop()
+
+# Process to send ping messages
+def _ping_sender(env, nodes):
+    yield env.timeout(15)  # Wait for the network to form
     
-    # Process to add new nodes periodically
-    def node_creator():
-        next_id = 1
-        while next_id < max_nodes:
-            yield env.timeout(random.randint(3, 8))
-            
-            # Create a new node
-            new_node = Node(env, node_id=next_id)
-            env.process(new_node.run())
+    while True:
+        yield env.timeout(random.randint(5, 10))
+        
+        # Only send if we have at least 2 nodes
+        if len(nodes) >= 2:
+            # Two distinct indices, without building a filtered list
+            i = random.randrange(len(nodes))
+            j = random.randrange(len(nodes) - 1)
+            sender = nodes[i]
+            target = nodes[j if j < i else j + 1]
             
-            # Choose a random existing node to bootstrap
-            bootstrap = random.choice(nodes)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s pinging %s", env.now, sender, target)
+            sender.send_message(target, 'PING')
+
+# Process to store data periodically; stored keys are appended to `keys`
+def _data_storer(env, nodes, keys, warmup, delay):
+    yield env.timeout(warmup)  # Wait for the network to form
+    
+    while True:
+        yield env.timeout(random.randint(*delay))
+        
+        if nodes:
+            # Choose a random node
+            node = random.choice(nodes)
             
-            # Join the ring
-            env.process(new_node.join(bootstrap))
+            # Create a key-value pair
+            key = f"key-{len(keys)}"
+            value = f"value-{len(keys)}"
+            keys.append(key)
             
-            # Add to our node list
-            nodes.append(new_node)
-            next_id += 1
+            # Store the data
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: Storing %s=%s via %s", env.now, key, value, node)
+            node.store(key, value)
+
+# Process to retrieve data periodically
+def _data_retriever(env, nodes, keys):
+    yield env.timeout(30)  # Wait for some data to be stored
     
-    # Process to remove nodes periodically
-    def node_remover():
-        yield env.timeout(30)  # Wait for some nodes to join
+    while True:
+        yield env.timeout(random.randint(7, 12))
         
-        while True:
-            yield env.timeout(random.randint(10, 20))
+        if nodes and keys:
+            # Choose a random node
+            node = random.choice(nodes)
             
-            # Only remove if we have enough nodes
-            if len(nodes) > 3:
-                # Choose a random node to remove (not the first node)
-                node = random.choice(nodes[1:])
-                node.leave()
-                nodes.remove(node)
+            # Choose a random existing key
+            key = keys[random.randint(0, len(keys) - 1)]
+            
+            # Retrieve the data
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: Retrieving %s via %s", env.now, key, node)
+            node.send_message(node, 'RETRIEVE', {'key': key, 'origin': node})
+
+# Process to test advanced routing
+def _route_tester(env, nodes):
+    yield env.timeout(60)  # Wait for the network and long links to form
     
-    # Process to send ping messages
-    def ping_sender():
-        yield env.timeout(15)  # Wait for the network to form
+    # Run several routing tests
+    for i in range(5):
+        yield env.timeout(random.randint(10, 20))
         
-        while True:
-            yield env.timeout(random.randint(5, 10))
+        if len(nodes) > 2:
+            # Choose random source and target
+            source = random.choice(nodes)
             
-            # Only send if we have at least 2 nodes
-            if len(nodes) >= 2:
-                sender = random.choice(nodes)
-                target = random.choice([n for n in nodes if n != sender])
-                
-                print(f"{env.now:.1f}: {sender} pinging {target}")
-                sender.send_message(target, 'PING')
+            # Generate a random target ID (may not be an actual node)
+            target_id = random.randint(0, 99)
+            
+            # Create a test message (hops and source are tracked by the ROUTE envelope)
+            test_message = {'text': f"Test message {i}"}
+            
+            # Send the message
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: Routing test message from %s to node ID %s", env.now, source, target_id)
+            source.route_message(target_id, test_message)
+
+
+def run_basic_simulation(env, max_nodes=10, duration=100):
+    """Run a basic DHT simulation"""
+    print("Starting basic DHT simulation...")
+    
+    # Create first node
+    first_node = Node(env, node_id=0)
+    env.process(first_node.run())
+    
+    nodes = [first_node]
     
     # Start the processes
-    env.process(node_creator())
-    env.process(node_remover())
-    env.process(ping_sender())
+    env.process(_node_creator(env, Node, nodes, max_nodes))
+    env.process(_node_remover(env, nodes, warmup=30, delay=(10, 20)))
+    env.process(_ping_sender(env, nodes))
     
     # Run the simulation
     env.run(until=duration)
+    flush_logging()
     
     # Print final ring structure
     print("\nFinal ring structure:")
@@ -145,99 +219,28 @@ def run_storage_simulation(env, max_nodes=10, duration=150):
     env.process(first_node.run())
     
     nodes = [first_node]
-    next_data_id = 0
-    
-    # Process to add new nodes periodically
-    def node_creator():
-        next_id = 1
-        while next_id < max_nodes:
-            yield env.timeout(random.randint(3, 8))
-            
-            # Create a new node
-            new_node = StorageNode(env, node_id=next_id)
-            env.process(new_node.run())
-            
-            # Choose a random existing node to bootstrap
-            bootstrap = random.choice(nodes)
-            
-            # Join the ring
-            env.process(new_node.join(bootstrap))
-            
-            # Add to our node list
-            nodes.append(new_node)
-            next_id += 1
-    
-    # Process to remove nodes periodically
-    def node_remover():
-        yield env.timeout(40)  # Wait for some nodes to join
-        
-        while True:
-            yield env.timeout(random.randint(15, 25))
-            
-            # Only remove if we have enough nodes
-            if len(nodes) > 3:
-                # Choose a random node to remove (not the first node)
-                node = random.choice(nodes[1:])
-                node.leave()
-                nodes.remove(node)
+    keys = []  # Stored keys, reused as-is by the retriever
     
-    # Process to store data periodically
-    def data_storer():
-        nonlocal next_data_id
-        yield env.timeout(20)  # Wait for the network to form
-        
-        while True:
-            yield env.timeout(random.randint(5, 10))
-            
-            if nodes:
-                # Choose a random node
-                node = random.choice(nodes)
-                
-                # Create a key-value pair
-                key = f"key-{next_data_id}"
-                value = f"value-{next_data_id}"
-                next_data_id += 1
-                
-                # Store the data
-                print(f"{env.now:.1f}: Storing {key}={value} via {node}")
-                node.store(key, value)
-    
-    # Process to retrieve data periodically
-    def data_retriever():
-        yield env.timeout(30)  # Wait for some data to be stored
-        
-        while True:
-            yield env.timeout(random.randint(7, 12))
-            
-            if nodes and next_data_id > 0:
-                # Choose a random node
-                node = random.choice(nodes)
-                
-                # Choose a random existing key
-                key_id = random.randint(0, next_data_id - 1)
-                key = f"key-{key_id}"
-                
-                # Retrieve the data
-                print(f"{env.now:.1f}: Retrieving {key} via {node}")
-                node.send_message(node, 'RETRIEVE', {'key': key, 'origin': node})
     
     # Start the processes
-    env.process(node_creator())
-    env.process(node_remover())
-    env.process(data_storer())
-    env.process(data_retriever())
+    env.process(_node_creator(env, StorageNode, nodes, max_nodes))
+    env.process(_node_remover(env, nodes, warmup=40, delay=(15, 25)))
+    env.process(_data_storer(env, nodes, keys, warmup=20, delay=(5, 10)))
+    env.process(_data_retriever(env, nodes, keys))
     
     # Run the simulation
     env.run(until=duration)
+    flush_logging()
     
     # Print data storage statistics
     print("\nData storage statistics:")
-    total_primary = sum(len(node.data) for node in nodes)
-    total_replicas = sum(len(node.replicas) for node in nodes)
+    # Per-node counts gathered once, then reused for totals and the listing
+    primary_counts = [len(node.data) for node in nodes]
+    replica_counts = [len(node.replicas) for node in nodes]
     
-    print(f"Total data items: {total_primary} primary, {total_replicas} replicated")
-    for node in nodes:
-        print(f"  {node}: {len(node.data)} primary items, {len(node.replicas)} replicated items")
+    print(f"Total data items: {sum(primary_counts)} primary, {sum(replica_counts)} replicated")
+    print("\n".join(f"  {node}: {p} primary items, {r} replicated items"
+                    for node, p, r in zip(nodes, primary_counts, replica_counts)))
 
 def run_advanced_simulation(env, max_nodes=15, duration=200):
     """Run a DHT simulation with advanced routing"""
@@ -248,108 +251,28 @@ def run_advanced_simulation(env, max_nodes=15, duration=200):
     env.process(first_node.run())
     
     nodes = [first_node]
-    next_data_id = 0
-    
-    # Process to add new nodes periodically
-    def node_creator():
-        next_id = 1
-        while next_id < max_nodes:
-            yield env.timeout(random.randint(3, 8))
-            
-            # Create a new node
-            new_node = AdvancedNode(env, node_id=next_id)
-            env.process(new_node.run())
-            
-            # Choose a random existing node to bootstrap
-            bootstrap = random.choice(nodes)
-            
-            # Join the ring
-            env.process(new_node.join(bootstrap))
-            
-            # Add to our node list
-            nodes.append(new_node)
-            next_id += 1
     
-    # Process to remove nodes periodically
-    def node_remover():
-        yield env.timeout(50)  # Wait for some nodes to join
-        
-        while True:
-            yield env.timeout(random.randint(20, 30))
-            
-            # Only remove if we have enough nodes
-            if len(nodes) > 3:
-                # Choose a random node to remove (not the first node)
-                node = random.choice(nodes[1:])
-                node.leave()
-                nodes.remove(node)
-    
-    # Process to store data periodically
-    def data_storer():
-        nonlocal next_data_id
-        yield env.timeout(25)  # Wait for the network to form
-        
-        while True:
-            yield env.timeout(random.randint(8, 15))
-            
-            if nodes:
-                # Choose a random node
-                node = random.choice(nodes)
-                
-                # Create a key-value pair
-                key = f"key-{next_data_id}"
-                value = f"value-{next_data_id}"
-                next_data_id += 1
-                
-                # Store the data
-                print(f"{env.now:.1f}: Storing {key}={value} via {node}")
-                node.store(key, value)
-    
-    # Process to test advanced routing
-    def route_tester():
-        yield env.timeout(60)  # Wait for the network and long links to form
-        
-        # Run several routing tests
-        for i in range(5):
-            yield env.timeout(random.randint(10, 20))
-            
-            if len(nodes) > 2:
-                # Choose random source and target
-                source = random.choice(nodes)
-                
-                # Generate a random target ID (may not be an actual node)
-                target_id = random.randint(0, 99)
-                
-                # Create a test message
-                test_message = {
-                    'text': f"Test message {i}",
-                    'hops': 0,
-                    'source': source
-                }
-                
-                # Send the message
-                print(f"{env.now:.1f}: Routing test message from {source} to node ID {target_id}")
-                source.route_message(target_id, test_message)
     
     # Start the processes
-    env.process(node_creator())
-    env.process(node_remover())
-    env.process(data_storer())
-    env.process(route_tester())
+    env.process(_node_creator(env, AdvancedNode, nodes, max_nodes))
+    env.process(_node_remover(env, nodes, warmup=50, delay=(20, 30)))
+    env.process(_data_storer(env, nodes, [], warmup=25, delay=(8, 15)))
+    env.process(_route_tester(env, nodes))
     
     # Run the simulation
     env.run(until=duration)
+    flush_logging()
     
     # Print statistics
     print("\nAdvanced routing statistics:")
-    total_long_links = sum(len(node.long_links) for node in nodes)
+    link_counts = [len(node.long_links) for node in nodes]
+    total_long_links = sum(link_counts)
     avg_long_links = total_long_links / len(nodes) if nodes else 0
     
     print(f"Total nodes: {len(nodes)}")
     print(f"Total long links: {total_long_links} (average: {avg_long_links:.2f} per node)")
     
-    for node in nodes:
-        print(f"  {node}: {len(node.long_links)} long links")
+    print("\n".join(f"  {node}: {n} long links" for node, n in zip(nodes, link_counts)))
 
 def main():
     """Entry point for the DHT simulator"""
@@ -362,8 +285,12 @@ def main():
                         help="Simulation duration")
     parser.add_argument("--seed", type=int, default=None, 
                         help="Random seed for reproducibility")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print every node event")
     
     args = parser.parse_args()
+    if args.verbose:
+        configure_logging()
     
     # Set random seed if provided
     if args.seed is not None:
@@ -7,19 +7,21 @@ Includes visualization of the DHT ring at the end of simulation.
 
 import simpy
 import random
-import hashlib
 import argparse
+import cProfile
+import functools
+import logging
+import pstats
 from enum import Enum
-import matplotlib.pyplot as plt
-import math
-import numpy as np
 
 # --------------------------- DHT NODES TYPES --------------------------- #
 
-from version1.Node import Node
+from version1.Node import Node, RING_SIZE, configure_logging, flush_logging
 from version1.StorageNode import StorageNode
 from version1.AdvancedNode import AdvancedNode
 
+log = logging.getLogger("version1.simulation")
+
 
 # --------------------------- ENUM CONFIG --------------------------- #
 
@@ -30,59 +32,88 @@ class DemoLevel(Enum):
 
 
 # --------------------------- VISUALIZATION --------------------------- #
+# matplotlib et numpy ne sont importés qu'au premier dessin (inutiles avec --no-viz)
+
+NODE_COLORS = {Node: 'blue', StorageNode: 'green', AdvancedNode: 'red'}
+# Classes qui stockent des données : test d'appartenance sur type(node), sans isinstance
+STORAGE_TYPES = frozenset({StorageNode, AdvancedNode})
+
+def long_link_edges(nodes):
+    """(node, target) pairs for the long links that are not ring neighbors, between nodes of `nodes`."""
+    present = set(nodes)  # A link may still point to a node that left the ring
+    return [(node, target_node)
+            for node in nodes if type(node) is AdvancedNode
+            for target_node in node.long_links.values()
+            if target_node in present
+            and target_node is not node.right_neighbor and target_node is not node.left_neighbor]
 
-def visualize_dht_ring(nodes, demo_level):
+@functools.lru_cache(maxsize=None)
+def _ring_slots():
+    """Unit-circle (x, y) of every ring id as a (RING_SIZE, 2) array, computed on first use."""
+    import numpy as np
+    angles = np.arange(RING_SIZE) * (2 * np.pi / RING_SIZE)
+    return np.column_stack((np.cos(angles), np.sin(angles)))
+
+def _draw_arrows(ax, pos, edges, color, alpha=1.0):
+    """Draw (src, dst) index pairs into `pos` as arrows covering 90% of each edge, in one call."""
+    if not edges:
+        return
+    import numpy as np
+    src, dst = np.array(edges, dtype=np.intp).T
+    start = pos[src]
+    delta = (pos[dst] - start) * 0.9
+    ax.quiver(start[:, 0], start[:, 1], delta[:, 0], delta[:, 1],
+              angles='xy', scale_units='xy', scale=1, width=0.003,
+              headwidth=5, headlength=7, headaxislength=6,
+              color=color, alpha=alpha)
+
+def visualize_dht_ring(nodes, demo_level, show=False):
     """
     Visualize the DHT ring with all nodes and their connections.
     """
-    plt.figure(figsize=(10, 10))
+    import matplotlib
+    if not show:
+        # No window: skip loading a GUI backend
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+    plt.figure(figsize=(8, 8), dpi=80)  # 640x640 px is enough for the ring image
     
     # Create a circle
     circle = plt.Circle((0, 0), 1, fill=False, color='black', linestyle='--')
     plt.gca().add_patch(circle)
     
-    # Calculate positions for each node based on their ID
-    node_positions = {}
-    for node in nodes:
-        angle = 2 * math.pi * node.node_id / 100  # Normalize to [0, 2π]
-        x = math.cos(angle)
-        y = math.sin(angle)
-        node_positions[node] = (x, y)
-    
-    # Draw nodes
-    for node, (x, y) in node_positions.items():
-        color = 'blue'
-        if isinstance(node, AdvancedNode):
-            color = 'red'
-        elif isinstance(node, StorageNode):
-            color = 'green'
-            
-        plt.plot(x, y, 'o', markersize=10, color=color)
-        plt.text(x*1.1, y*1.1, str(node.node_id), fontsize=9)
-    
-    # Draw connections (right neighbor)
-    for node in nodes:
-        if node.right_neighbor != node:  # Skip self-connections
-            start_pos = node_positions[node]
-            end_pos = node_positions[node.right_neighbor]
-            plt.arrow(start_pos[0], start_pos[1], 
-                      (end_pos[0] - start_pos[0])*0.9, 
-                      (end_pos[1] - start_pos[1])*0.9,
-                      head_width=0.05, head_length=0.1, fc='black', ec='black')
+    # Look up each node's position by ID in the precomputed slot table
+    ids = np.fromiter((node.node_id for node in nodes), dtype=np.intp, count=len(nodes))
+    slots = _ring_slots()
+    pos = slots[ids]  # (N, 2), same order as nodes
+    node_index = {id(node): i for i, node in enumerate(nodes)}
+    
+    # Single pass over the nodes: color by type, label, and collect stored data
+    show_data = demo_level in ['storage', 'advanced']
+    colors = []
+    data_text = []
+    for node, (x, y) in zip(nodes, pos.tolist()):
+        colors.append(NODE_COLORS.get(type(node), 'blue'))
+        plt.text(x*1.1, y*1.1, str(node.node_id), fontsize=9, parse_math=False)
+        if show_data and type(node) in STORAGE_TYPES and node.data:
+            data_items = ", ".join([f"{k}={v}" for k, v in node.data.items()])
+            data_text.append(f"Node {node.node_id}: {data_items}")
+    
+    # Draw nodes as one scatter artist
+    plt.scatter(pos[:, 0], pos[:, 1], s=100, c=colors, zorder=2)
+    
+    # Draw connections (right neighbor), all edges in a single quiver
+    ax = plt.gca()
+    edges = [(i, node_index[id(node.right_neighbor)])
+             for i, node in enumerate(nodes) if node.right_neighbor is not node]  # Skip self-connections
+    _draw_arrows(ax, pos, edges, color='black')
     
     # Draw long links for advanced nodes
     if demo_level == 'advanced':
-        for node in nodes:
-            if isinstance(node, AdvancedNode):
-                for target_id, target_node in node.long_links.items():
-                    if target_node != node.right_neighbor and target_node != node.left_neighbor:
-                        start_pos = node_positions[node]
-                        end_pos = node_positions[target_node]
-                        plt.arrow(start_pos[0], start_pos[1], 
-                                  (end_pos[0] - start_pos[0])*0.9, 
-                                  (end_pos[1] - start_pos[1])*0.9,
-                                  head_width=0.05, head_length=0.1, fc='purple', ec='purple',
-                                  linestyle='--')
+        edges = [(node_index[id(node)], node_index[id(target_node)])
+                 for node, target_node in long_link_edges(nodes)]
+        _draw_arrows(ax, pos, edges, color='purple', alpha=0.5)
     
     # Add legend
     legend_items = []
@@ -92,7 +123,7 @@ def visualize_dht_ring(nodes, demo_level):
         legend_items.append(plt.plot([], [], 'o', color='green', label='Storage Node')[0])
     elif demo_level == 'advanced':
         legend_items.append(plt.plot([], [], 'o', color='red', label='Advanced Node')[0])
-        legend_items.append(plt.Line2D([0], [0], color='purple', linestyle='--', 
+        legend_items.append(plt.Line2D([0], [0], color='purple', alpha=0.5, 
                           marker='>', markersize=8, label='Long Link'))
     
     legend_items.append(plt.Line2D([0], [0], color='black', marker='>', 
@@ -109,161 +140,128 @@ def visualize_dht_ring(nodes, demo_level):
     plt.grid(True)
     
     # Add ID circle markers
-    for i in range(0, 100, 10):
-        angle = 2 * math.pi * i / 100
-        x = 1.2 * math.cos(angle)
-        y = 1.2 * math.sin(angle)
+    for i, (x, y) in zip(range(0, RING_SIZE, 10), (1.2 * slots[::10]).tolist()):
         plt.text(x, y, str(i), fontsize=8, ha='center', va='center',
-                color='gray', alpha=0.7)
+                color='gray', alpha=0.7, parse_math=False)
     
     # Add data visualization for storage nodes
-    if demo_level in ['storage', 'advanced']:
-        data_text = []
-        for node in nodes:
-            if isinstance(node, StorageNode) and node.data:
-                data_items = ", ".join([f"{k}={v}" for k, v in node.data.items()])
-                data_text.append(f"Node {node.node_id}: {data_items}")
-        
-        if data_text:
-            plt.figtext(0.5, 0.02, "\n".join(data_text), ha='center', fontsize=8, 
-                       bbox=dict(facecolor='white', alpha=0.8))
+    if data_text:
+        plt.figtext(0.5, 0.02, "\n".join(data_text), ha='center', fontsize=8, 
+                   bbox=dict(facecolor='white', alpha=0.8), parse_math=False)
     
     plt.tight_layout()
     plt.savefig(f"dht_ring_{demo_level}.png")
     print(f"Visualization saved as 'dht_ring_{demo_level}.png'")
-    plt.show()
+    if show:
+        plt.show()
+    plt.close()
 
 # --------------------------- MAIN SIMULATION ENTRY --------------------------- #
 
-def run_basic_simulation(env, num_nodes):
-    """Run a basic DHT simulation with simple nodes."""
-    print("Running BASIC simulation...")
-    
-    # Create nodes with random IDs
-    nodes = []
-    for _ in range(num_nodes):
-        node_id = random.randint(0, 99)
-        node = Node(env, node_id)
-        nodes.append(node)
+def build_ring(env, nodes, new_nodes, settle=0):
+    """Start the given nodes, join them through the first (bootstrap) node, then let the ring settle."""
+    nodes.extend(new_nodes)
+    for node in nodes:
         env.process(node.run())
     
     # First node is the bootstrap node
     bootstrap = nodes[0]
     
-    # Other nodes join the network through the bootstrap
+    # Other nodes join the network through the bootstrap, all at once: it
+    # serves their requests in order, so each one sees the previous inserts
     for node in nodes[1:]:
         env.process(node.join(bootstrap))
-        yield env.timeout(1)  # Wait for the join process to complete
+    # One wait covers the joins (same budget as staggered ones) and the settle time
+    yield env.timeout(len(nodes) - 1 + settle)
+
+def run_basic_simulation(env, num_nodes, out):
+    """Run a basic DHT simulation with simple nodes."""
+    print("Running BASIC simulation...")
     
-    # Let the network stabilize
-    yield env.timeout(5)
+    # Create nodes with random IDs
+    nodes = []
+    out.append(nodes)  # Visible to main() even if the run is cut short
+    node_ids = random.sample(range(100), num_nodes)  # Unique IDs, drawn in one call
+    yield from build_ring(env, nodes, [Node(env, node_id) for node_id in node_ids], settle=5)
     
     # Perform some ping operations
-    for _ in range(3):
-        sender = random.choice(nodes)
-        receiver = random.choice(nodes)
+    peers = random.choices(nodes, k=6)  # 3 (sender, receiver) pairs in one draw
+    for sender, receiver in zip(peers[::2], peers[1::2]):
         if sender != receiver:
-            print(f"{env.now:.1f}: {sender} pings {receiver}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("%.1f: %s pings %s", env.now, sender, receiver)
             sender.send_message(receiver, 'PING')
             yield env.timeout(1)
     
     # Simulate a node leaving
-    leaving_node = nodes[random.randint(1, len(nodes)-1)]
+    idx = random.randint(1, len(nodes)-1)
+    leaving_node = nodes[idx]
     leaving_node.leave()
-    nodes.remove(leaving_node)
-    
-    # Let the network stabilize again
-    yield env.timeout(5)
+    nodes[idx] = nodes[-1]
+    nodes.pop()
     
     return nodes
 
-def run_storage_simulation(env, num_nodes):
+def run_storage_simulation(env, num_nodes, out):
     """Run a storage DHT simulation with nodes that can store and retrieve data."""
     print("Running STORAGE simulation...")
     
     # Create storage nodes with random IDs
     nodes = []
-    for _ in range(num_nodes):
-        node_id = random.randint(0, 99)
-        node = StorageNode(env, node_id)
-        nodes.append(node)
-        env.process(node.run())
-    
-    # First node is the bootstrap node
-    bootstrap = nodes[0]
-    
-    # Other nodes join the network through the bootstrap
-    for node in nodes[1:]:
-        env.process(node.join(bootstrap))
-        yield env.timeout(1)  # Wait for the join process to complete
-    
-    # Let the network stabilize
-    yield env.timeout(5)
+    out.append(nodes)  # Visible to main() even if the run is cut short
+    node_ids = random.sample(range(100), num_nodes)  # Unique IDs, drawn in one call
+    yield from build_ring(env, nodes, [StorageNode(env, node_id) for node_id in node_ids], settle=5)
     
     # Store some data
-    for i in range(5):
-        node = random.choice(nodes)
+    for i, node in enumerate(random.choices(nodes, k=5)):
         key = f"key{i}"
         value = f"value{i}"
-        print(f"{env.now:.1f}: {node} initiates storage of {key}={value}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s initiates storage of %s=%s", env.now, node, key, value)
         node.store(key, value)
         yield env.timeout(2)
     
     # Simulate a node leaving
-    leaving_node = nodes[random.randint(1, len(nodes)-1)]
+    idx = random.randint(1, len(nodes)-1)
+    leaving_node = nodes[idx]
     leaving_node.leave()
-    nodes.remove(leaving_node)
+    nodes[idx] = nodes[-1]
+    nodes.pop()
     
     # Let the network stabilize again
     yield env.timeout(5)
     
     # Store some more data
-    for i in range(5, 8):
-        node = random.choice(nodes)
+    for i, node in enumerate(random.choices(nodes, k=3), start=5):
         key = f"key{i}"
         value = f"value{i}"
-        print(f"{env.now:.1f}: {node} initiates storage of {key}={value}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s initiates storage of %s=%s", env.now, node, key, value)
         node.store(key, value)
         yield env.timeout(2)
     
     return nodes
 
-def run_advanced_simulation(env, num_nodes, long_link_mode='triche'):
+def run_advanced_simulation(env, num_nodes, out, long_link_mode='triche'):
     """Run an advanced DHT simulation with nodes that have long links for efficient routing."""
     print("Running ADVANCED simulation...")
 
     # Crée des IDs uniques (sinon conflits possibles avec randint)
     ids = random.sample(range(100), num_nodes)
 
-    # Crée tous les nœuds avec une référence globale si nécessaire
+    # Crée tous les nœuds, initialisés selon le mode (triche, piggyback ou symphony)
     nodes = []
-    for node_id in ids:
-        node = AdvancedNode(env, node_id)
-        # Initialisation selon le mode (triche ou piggyback)
-        if long_link_mode == 'triche':
-            node.init(env, node_id, all_nodes=nodes, mode='triche')
-        else:
-            node.init(env, node_id, mode='piggyback')
-        nodes.append(node)
-        env.process(node.run())
-
-    # Premier nœud comme bootstrap
-    bootstrap = nodes[0]
-
-    # Les autres rejoignent le réseau via le bootstrap
-    for node in nodes[1:]:
-        env.process(node.join(bootstrap))
-        yield env.timeout(1)
-
-    # Laisse le réseau se stabiliser
-    yield env.timeout(10)
+    out.append(nodes)  # Visible par main() même si la simulation est interrompue
+    # Construit l'anneau puis laisse le réseau se stabiliser
+    yield from build_ring(env, nodes, [AdvancedNode(env, node_id, mode=long_link_mode) for node_id in ids],
+                          settle=10)
 
     # Stockage de données
-    for i in range(5):
-        node = random.choice(nodes)
+    for i, node in enumerate(random.choices(nodes, k=5)):
         key = f"key{i}"
         value = f"value{i}"
-        print(f"{env.now:.1f}: {node} initiates storage of {key}={value}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s initiates storage of %s=%s", env.now, node, key, value)
         node.store(key, value)
         yield env.timeout(2)
 
@@ -271,47 +269,47 @@ def run_advanced_simulation(env, num_nodes, long_link_mode='triche'):
     yield env.timeout(5)
 
     # Envoi de messages routés
-    for i in range(3):
-        sender = random.choice(nodes)
-        target_id = random.randint(0, 99)
+    # Expéditeurs et cibles tirés en un appel chacun
+    senders = random.choices(nodes, k=3)
+    target_ids = random.choices(range(100), k=3)
+    for i, (sender, target_id) in enumerate(zip(senders, target_ids)):
         message = f"Message {i} from {sender} to {target_id}"
-        print(f"{env.now:.1f}: {sender} sends routed message to {target_id}: {message}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%.1f: %s sends routed message to %s: %s", env.now, sender, target_id, message)
         sender.route_message(target_id, message)
         yield env.timeout(3)
 
     return nodes
 
 def print_dht_statistics(nodes, demo_level):
-    print("\n=== DHT STATISTICS REPORT ===")
-    print(f"Mode: {demo_level.value.upper()}")
-    print(f"Total active nodes: {len(nodes)}\n")
+    lines = ["\n=== DHT STATISTICS REPORT ===",
+             f"Mode: {demo_level.value.upper()}",
+             f"Total active nodes: {len(nodes)}\n"]
 
     for node in sorted(nodes, key=lambda n: n.node_id):
-        print(f"Node ID: {node.node_id}")
+        kind = type(node)  # Classe lue une fois par nœud
+        lines.append(f"Node ID: {node.node_id}")
         
-        # Affiche les voisins s'ils existent
-        left = getattr(node, 'left_neighbor', None)
-        right = getattr(node, 'right_neighbor', None)
-        if left:
-            print(f"  Left Neighbor: {left.node_id}")
-        if right:
-            print(f"  Right Neighbor: {right.node_id}")
+        # Affiche les voisins
+        lines.append(f"  Left Neighbor: {node.left_neighbor.node_id}")
+        lines.append(f"  Right Neighbor: {node.right_neighbor.node_id}")
         
         # Affiche les données stockées si c'est un StorageNode
-        if isinstance(node, StorageNode) and hasattr(node, 'data'):
-            data_count = len(node.data)
-            print(f"  Stored Keys: {data_count}")
-            if data_count > 0:
-                print(f"    Keys: {list(node.data.keys())}")
+        if kind in STORAGE_TYPES:
+            data = node.data
+            lines.append(f"  Stored Keys: {len(data)}")
+            if data:
+                lines.append(f"    Keys: {list(data)}")
 
         # Affiche les liens longs si c’est un AdvancedNode
-        if isinstance(node, AdvancedNode) and hasattr(node, 'long_links'):
-            long_link_ids = list(node.long_links.keys())
-            print(f"  Long Links: {len(long_link_ids)} -> {long_link_ids}")
+        if kind is AdvancedNode:
+            long_link_ids = list(node.long_links)
+            lines.append(f"  Long Links: {len(long_link_ids)} -> {long_link_ids}")
         
-        print("-" * 40)
+        lines.append("-" * 40)
 
-    print("=== END OF REPORT ===\n")
+    lines.append("=== END OF REPORT ===\n")
+    print("\n".join(lines))  # Un seul appel à print pour tout le rapport
 
 
 def main():
@@ -324,9 +322,19 @@ def main():
                         help="Simulation time in seconds (default: 60)")
     parser.add_argument("--seed", type=int, default=None, 
                         help="Random seed for reproducibility")
-    parser.add_argument("--long-links", choices=["triche", "piggyback"], default="triche",
+    parser.add_argument("--long-links", choices=["triche", "piggyback", "symphony"], default="triche",
                     help="Méthode pour les liens longs (default: triche)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print every node event")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the simulation run and save stats to dht_profile_<mode>.prof")
+    parser.add_argument("--show", action="store_true",
+                        help="Open the ring visualization in a window (default: only save it)")
+    parser.add_argument("--no-viz", action="store_true",
+                        help="Skip the ring visualization (matplotlib is never imported)")
     args = parser.parse_args()
+    if args.verbose:
+        configure_logging()
     
     # Set random seed if provided
     if args.seed is not None:
@@ -335,56 +343,42 @@ def main():
     # Create SimPy environment
     env = simpy.Environment()
     
-    # Store all nodes in a global list
-    all_nodes = []
+    # The runner puts its node list here as soon as it starts
+    nodes_box = []
     
     # Run the appropriate simulation based on the mode
     if args.mode == "basic":
         demo_level = DemoLevel.BASIC
-        simulation = run_basic_simulation(env, args.nodes)
+        simulation = run_basic_simulation(env, args.nodes, nodes_box)
     elif args.mode == "storage":
         demo_level = DemoLevel.STORAGE
-        simulation = run_storage_simulation(env, args.nodes)
+        simulation = run_storage_simulation(env, args.nodes, nodes_box)
     elif args.mode == "advanced":
         demo_level = DemoLevel.ADVANCED
-        simulation = run_advanced_simulation(env, args.nodes, long_link_mode=args.long_links)
-    
-    # Keep a reference to the generator
-    sim_generator = env.process(simulation)
-    
-    # Create a callback to store the nodes when the simulation ends
-    def store_nodes(event):
-        global final_nodes
-        final_nodes = event.value
-    
-    # Add a callback to the simulation completion
-    sim_generator.callbacks.append(store_nodes)
+        simulation = run_advanced_simulation(env, args.nodes, nodes_box, long_link_mode=args.long_links)
     
-    # Define a global variable to store the final nodes
-    global final_nodes
-    final_nodes = []
+    env.process(simulation)
     
     # Run the simulation until the specified time
-    env.run(until=args.time)
-    
-    # If the simulation didn't complete, extract the nodes from the generator
-    if not final_nodes:
-        # We need to take the nodes from the generator's frame
-        import inspect
-        frame = inspect.currentframe()
-        for frame_info in inspect.getouterframes(frame):
-            if 'simulation' in frame_info.frame.f_locals:
-                gen = frame_info.frame.f_locals['simulation']
-                if hasattr(gen, 'gi_frame') and gen.gi_frame is not None:
-                    if 'nodes' in gen.gi_frame.f_locals:
-                        final_nodes = gen.gi_frame.f_locals['nodes']
-                        break
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        env.run(until=args.time)
+        profiler.disable()
+    else:
+        env.run(until=args.time)
+    flush_logging()
+    if args.profile:
+        profiler.dump_stats(f"dht_profile_{args.mode}.prof")
+        pstats.Stats(profiler).strip_dirs().sort_stats('cumulative').print_stats(30)
+        print(f"Profile saved as 'dht_profile_{args.mode}.prof'")
+    final_nodes = nodes_box[0] if nodes_box else []
     
     # Visualize the final DHT ring
-    if final_nodes:
-        visualize_dht_ring(final_nodes, demo_level.value)
-    else:
+    if not final_nodes:
         print("Error: Could not extract nodes for visualization.")
+    elif not args.no_viz:
+        visualize_dht_ring(final_nodes, demo_level.value, show=args.show)
     
     print_dht_statistics(final_nodes, demo_level)
 
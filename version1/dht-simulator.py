@@ -7,11 +7,10 @@ Simulates a Distributed Hash Table (DHT) with basic, storage, and advanced routi
 
 import simpy
 import random
-import hashlib
 import argparse
 from enum import Enum
 
-from version1.Node import Node
+from version1.Node import Node, configure_logging
 from version1.StorageNode import StorageNode
 from version1.AdvancedNode import AdvancedNode
 
@@ -28,7 +27,10 @@ def main():
     parser.add_argument('--demo', type=str, choices=['basic', 'storage', 'advanced'], default='basic')
     parser.add_argument('--nodes', type=int, default=10)
     parser.add_argument('--duration', type=int, default=100)
+    parser.add_argument('--verbose', action='store_true')
     args = parser.parse_args()
+    if args.verbose:
+        configure_logging()
 
     print("\nDHT Simulation")
     print("==============")